@@ -1,26 +1,61 @@
 
-from fastapi import FastAPI, Query, Header, HTTPException
-from typing import Optional, List
+from fastapi import FastAPI, Query, Header, HTTPException, Request
+from typing import Optional, List, AsyncIterator, Tuple
 from datetime import datetime
-from fastapi.responses import PlainTextResponse
-import psycopg2
+from fastapi.responses import Response, StreamingResponse, ORJSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from itertools import count
+from cachetools import TTLCache
+import asyncio
+import asyncpg
+import base64
+import hashlib
+import orjson
 import os
+import re
 
 # ---------------- Config ----------------
+# Both databases are reached through PgBouncer in transaction mode, so no
+# session state (SET) survives past one transaction. asyncpg's protocol-level
+# prepared statements are tracked by PgBouncer (max_prepared_statements).
+# statement_timeout is applied per database in db/pgbouncer/pgbouncer.ini; the
+# pools below must not RESET ALL on release or they would clear it for every
+# client sharing that server connection.
 # TimescaleDB (raw)
-TIMESCALE_HOST = os.getenv("TIMESCALE_HOST", "timescaledb_poc")
-TIMESCALE_PORT = int(os.getenv("TIMESCALE_PORT", "5432"))
+TIMESCALE_HOST = os.getenv("TIMESCALE_HOST", "pgbouncer")
+TIMESCALE_PORT = int(os.getenv("TIMESCALE_PORT", "6432"))
 TIMESCALE_DB   = os.getenv("TIMESCALE_DB", "sensordata")
 TIMESCALE_USER = os.getenv("TIMESCALE_USER", "admin")
 TIMESCALE_PASS = os.getenv("TIMESCALE_PASS", "admin")
 
 # PostgreSQL (analytics)
-PG_HOST = os.getenv("PG_HOST", "postgres")
-PG_PORT = int(os.getenv("PG_PORT", "5432"))
+PG_HOST = os.getenv("PG_HOST", "pgbouncer")
+PG_PORT = int(os.getenv("PG_PORT", "6432"))
 PG_DB   = os.getenv("PG_DB", "analytics")
 PG_USER = os.getenv("PG_USER", "admin")
 PG_PASS = os.getenv("PG_PASS", "admin")
 
+# Connection pools (per process)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "5"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "20"))
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "2.0"))
+# Client-side per-query timeout (seconds); matches PgBouncer's statement_timeout
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "30"))
+
+# CSV streaming: COPY chunks buffered ahead of the client
+COPY_QUEUE_SIZE = int(os.getenv("COPY_QUEUE_SIZE", "16"))
+
+# Response cache TTLs (seconds, per process)
+CACHE_TTL_STATS = int(os.getenv("CACHE_TTL_STATS", "60"))
+CACHE_TTL_ANALYTICS = int(os.getenv("CACHE_TTL_ANALYTICS", "300"))
+# Cache-Control max-age (seconds) for ETag'd responses
+HTTP_MAX_AGE = int(os.getenv("HTTP_MAX_AGE", "300"))
+
+# Responses smaller than this (bytes) are sent uncompressed
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1024"))
+
 # API key
 API_KEY = os.getenv("API_KEY", "supersecretkey123")
 
@@ -29,83 +64,309 @@ app = FastAPI(
     title="Digital Twin Data API",
     description="Access raw sensor data (TimescaleDB) and daily analytics (PostgreSQL).",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
 )
+# CSV and row-heavy JSON compress ~8-15x; streamed CSV is compressed chunk by chunk.
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE)
+
+# ---------------- Connection Pools ----------------
+async def _init_conn(conn: asyncpg.Connection):
+    # Runs once per new connection, so min_size connections are warm at startup.
+    await conn.execute("SELECT 1")
+
+async def _reset_conn(conn: asyncpg.Connection):
+    # Replaces asyncpg's default reset (which ends in RESET ALL): only roll back
+    # a transaction left open, so PgBouncer's connect_query settings survive.
+    if conn.is_in_transaction():
+        await conn.execute("ROLLBACK")
+
+@app.on_event("startup")
+async def open_pools():
+    app.state.ts_pool = await asyncpg.create_pool(
+        host=TIMESCALE_HOST, port=TIMESCALE_PORT,
+        database=TIMESCALE_DB, user=TIMESCALE_USER, password=TIMESCALE_PASS,
+        min_size=DB_POOL_MIN, max_size=DB_POOL_MAX, init=_init_conn, reset=_reset_conn,
+        command_timeout=DB_COMMAND_TIMEOUT,
+    )
+    app.state.pg_pool = await asyncpg.create_pool(
+        host=PG_HOST, port=PG_PORT,
+        database=PG_DB, user=PG_USER, password=PG_PASS,
+        min_size=DB_POOL_MIN, max_size=DB_POOL_MAX, init=_init_conn, reset=_reset_conn,
+        command_timeout=DB_COMMAND_TIMEOUT,
+    )
+
+@app.on_event("shutdown")
+async def close_pools():
+    for name in ("ts_pool", "pg_pool"):
+        pool = getattr(app.state, name, None)
+        if pool is not None:
+            await pool.close()
+
+async def _acquire_conn(pool: asyncpg.Pool) -> asyncpg.Connection:
+    try:
+        return await pool.acquire(timeout=DB_ACQUIRE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Database connection pool exhausted, retry later.")
+
+@asynccontextmanager
+async def _acquire(pool: asyncpg.Pool) -> AsyncIterator[asyncpg.Connection]:
+    conn = await _acquire_conn(pool)
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+def ts_conn():
+    return _acquire(app.state.ts_pool)
+
+def pg_conn():
+    return _acquire(app.state.pg_pool)
+
+# ---------------- Response Cache ----------------
+# /buildings and /raw-stats barely move minute to minute and analytics rows change
+# at most daily, so their responses are served from memory within the TTL.
+STATS_CACHE: TTLCache = TTLCache(maxsize=256, ttl=CACHE_TTL_STATS)
+ANALYTICS_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=CACHE_TTL_ANALYTICS)
+
+def cache_key(request: Request) -> str:
+    params = sorted(request.query_params.multi_items())
+    return hashlib.blake2b(f"{request.url.path}|{params}".encode(), digest_size=16).hexdigest()
+
+def render_json(body: dict) -> Tuple[bytes, str]:
+    # Serialized once per cache fill; the ETag is a hash of the JSON bytes. It is weak
+    # because GZipMiddleware sends the same tag for gzip and identity encodings.
+    content = orjson.dumps(body)
+    return content, f'W/"{hashlib.blake2b(content, digest_size=8).hexdigest()}"'
+
+def conditional_response(request: Request, rendered: Tuple[bytes, str]) -> Response:
+    # Lets browsers and HTTP caches revalidate with If-None-Match and get a bodiless 304.
+    # Vary on the API key so a shared cache never serves one client's response to another.
+    content, etag = rendered
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={HTTP_MAX_AGE}", "Vary": "X-API-Key"}
+    if_none_match = request.headers.get("if-none-match", "")
+    # If-None-Match uses weak comparison: only the opaque-tags have to match.
+    if etag.removeprefix("W/") in (t.strip().removeprefix("W/") for t in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(content, media_type="application/json", headers=headers)
 
 # ---------------- Helpers ----------------
 def require_api_key(x_api_key: Optional[str]):
     if API_KEY and (x_api_key != API_KEY):
         raise HTTPException(status_code=401, detail="Invalid or missing API key.")
 
-def ts_conn():
-    return psycopg2.connect(
-        host=TIMESCALE_HOST, port=TIMESCALE_PORT,
-        dbname=TIMESCALE_DB, user=TIMESCALE_USER, password=TIMESCALE_PASS
-    )
+_COPY_DONE = object()
 
-def pg_conn():
-    return psycopg2.connect(
-        host=PG_HOST, port=PG_PORT,
-        dbname=PG_DB, user=PG_USER, password=PG_PASS
-    )
+def _release_once(pool: asyncpg.Pool, conn: asyncpg.Connection):
+    # Both the CSV generator and its response try to give the connection back;
+    # whichever runs first does, the other is a no-op.
+    released = False
+
+    async def release():
+        nonlocal released
+        if not released:
+            released = True
+            await pool.release(conn)
+    return release
+
+class PooledStreamingResponse(StreamingResponse):
+    # Releases the body's pooled connection however the response ends. If the
+    # client disconnects before the body is first iterated, the generator's own
+    # finally never runs, so the release cannot live only there.
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                await self.body_iterator.aclose()
+            finally:
+                await self._release()
+
+async def stream_csv(conn: asyncpg.Connection, sql: str, params: List, release) -> AsyncIterator[bytes]:
+    # COPY (...) TO STDOUT lets Postgres format and quote the CSV in C. The COPY
+    # runs as a task pushing chunks into a bounded queue that this generator drains,
+    # so a slow client applies backpressure instead of buffering the result.
+    # conn is acquired by the caller; release() gives it back once the stream ends.
+    q: asyncio.Queue = asyncio.Queue(maxsize=COPY_QUEUE_SIZE)
+
+    async def produce():
+        try:
+            await conn.copy_from_query(sql, *params, output=q.put, format="csv", header=True)
+            await q.put(_COPY_DONE)
+        except Exception as e:
+            await q.put(e)
+
+    task = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await q.get()
+            if item is _COPY_DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await release()
+
+async def csv_response(pool: asyncpg.Pool, sql: str, params: List) -> StreamingResponse:
+    # Acquire before the response starts so an exhausted pool is still a 503,
+    # not an error raised mid-stream after the 200 headers went out.
+    conn = await _acquire_conn(pool)
+    release = _release_once(pool, conn)
+    return PooledStreamingResponse(stream_csv(conn, sql, params, release), release, media_type="text/csv")
+
+# Postgres prints UTC offsets as "+00" (e.g. in CSV exports); fromisoformat
+# before Python 3.11 only accepts "+00:00".
+_SHORT_UTC_OFFSET = re.compile(r"(\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?[+-]\d{2})$")
 
-def rows_to_dicts(cursor, rows):
-    cols = [desc[0] for desc in cursor.description]
-    return [dict(zip(cols, r)) for r in rows]
+@lru_cache(maxsize=1024)
+def _parse_dt_cached(dt_str: str) -> datetime:
+    # Dashboards re-send the same handful of range bounds; datetimes are immutable.
+    return datetime.fromisoformat(_SHORT_UTC_OFFSET.sub(r"\1:00", dt_str))
 
 def parse_dt(dt_str: str) -> datetime:
     try:
-        return datetime.fromisoformat(dt_str)
+        return _parse_dt_cached(dt_str)
     except Exception:
         raise HTTPException(status_code=400, detail=f"Invalid datetime format: {dt_str}. Use YYYY-MM-DD or ISO8601.")
 
+def encode_cursor(key, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{key.isoformat()}|{row_id}".encode()).decode()
+
+def decode_cursor(cursor: str, parse_key):
+    # Inverse of encode_cursor: (sort key, id) of the last row of the previous page.
+    try:
+        key, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return parse_key(key), int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor.")
+
+def keyset_after(cursor: Optional[str], after_key: Optional[str], after_id: Optional[int],
+                 key_param: str, parse_key) -> tuple:
+    # Position to seek past: next_cursor of a JSON page, or the last row's key and
+    # id passed as plain params (CSV exports carry no cursor).
+    if cursor:
+        if after_key is not None or after_id is not None:
+            raise HTTPException(status_code=400, detail=f"Use either cursor or {key_param}/after_id, not both.")
+        return decode_cursor(cursor, parse_key)
+    if after_key is None and after_id is None:
+        return ()
+    if after_key is None or after_id is None:
+        raise HTTPException(status_code=400, detail=f"{key_param} and after_id must be given together.")
+    return parse_key(after_key), after_id
+
+# ---------------- SQL Templates ----------------
+RAW_DATA_FIELDS = ("id", "building", "timestamp", "temperature", "humidity", "occupancy")
+ANALYTICS_FIELDS = ("id", "building", "date", "avg_temperature", "avg_humidity", "occupancy_rate")
+
+def select_columns(fields: Optional[str], allowed: Tuple[str, ...], key_col: str) -> str:
+    # Whitelisted subset for the SELECT list. id and the sort key are always kept
+    # since they make up the pagination cursor; columns keep their canonical order
+    # so equal subsets produce identical SQL text.
+    if not fields:
+        return ", ".join(allowed)
+    requested = {f for f in fields.split(",") if f}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}. Allowed: {', '.join(allowed)}.")
+    keep = requested | {"id", key_col}
+    return ", ".join(c for c in allowed if c in keep)
+
+@lru_cache(maxsize=None)
+def select_page_sql(table: str, columns: str, key_col: str, has_start: bool, has_end: bool,
+                    has_building: bool, has_cursor: bool, order: str) -> str:
+    # Built once per filter combination, so every request with the same shape sends
+    # identical text and asyncpg's per-connection statement cache prepares (parses and
+    # plans) it only once. Placeholders follow the order the endpoints build params:
+    # start, end, building, cursor key, cursor id, limit.
+    arg = (f"${i}" for i in count(1))
+    where = []
+    if has_start:
+        where.append(f"{key_col} >= {next(arg)}")
+    if has_end:
+        where.append(f"{key_col} < {next(arg)}")
+    if has_building:
+        where.append(f"building = {next(arg)}")
+    if has_cursor:
+        # Keyset pagination: seek past the last (key, id) seen instead of OFFSET.
+        # The plain key bound lets the range come straight off the index.
+        after_key, after_id = next(arg), next(arg)
+        cmp = ">" if order == "asc" else "<"
+        where.append(f"{key_col} {cmp}= {after_key}")
+        where.append(f"({key_col}, id) {cmp} ({after_key}, {after_id})")
+    direction = "ASC" if order == "asc" else "DESC"
+    return (
+        f"SELECT {columns} FROM {table}"
+        + (" WHERE " + " AND ".join(where) if where else "")
+        + f" ORDER BY {key_col} {direction}, id {direction} LIMIT {next(arg)}"
+    )
+
 # ---------------- Health ----------------
 @app.get("/health", summary="Health check")
-def health():
+async def health():
     try:
-        with ts_conn() as cts, pg_conn() as cpg:
-            pass
+        async with ts_conn() as cts, pg_conn() as cpg:
+            for conn in (cts, cpg):
+                await conn.execute("SELECT 1;")
         return {"status": "ok"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # ---------------- Metadata ----------------
 @app.get("/buildings", summary="List distinct buildings from sensor_data")
-def list_buildings(x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")):
+async def list_buildings(request: Request, x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")):
     require_api_key(x_api_key)
-    with ts_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT DISTINCT building FROM sensor_data ORDER BY building;")
-            rows = cur.fetchall()
-    return {"buildings": [r[0] for r in rows]}
+    key = cache_key(request)
+    if (rendered := STATS_CACHE.get(key)) is None:
+        async with ts_conn() as conn:
+            rows = await conn.fetch("SELECT DISTINCT building FROM sensor_data ORDER BY building;")
+        rendered = STATS_CACHE[key] = render_json({"buildings": [r[0] for r in rows]})
+    return conditional_response(request, rendered)
 
 # ---------------- Raw Stats (TimescaleDB) ----------------
 @app.get("/raw-stats", summary="Get raw data stats from TimescaleDB")
-def raw_stats(x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")):
+async def raw_stats(request: Request, x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")):
     require_api_key(x_api_key)
-    with ts_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) FROM sensor_data;")
-            total = cur.fetchone()[0]
-            cur.execute("SELECT MIN(timestamp), MAX(timestamp) FROM sensor_data;")
-            min_ts, max_ts = cur.fetchone()
-            cur.execute("SELECT building, COUNT(*) FROM sensor_data GROUP BY building ORDER BY building;")
-            per_building = cur.fetchall()
-    return {
-        "total_rows": total,
-        "min_timestamp": min_ts.isoformat() if min_ts else None,
-        "max_timestamp": max_ts.isoformat() if max_ts else None,
-        "rows_per_building": [{"building": b, "rows": c} for (b, c) in per_building]
+    key = cache_key(request)
+    if (cached := STATS_CACHE.get(key)) is not None:
+        return ORJSONResponse(cached)
+    # Rolled up from the hourly sensor_counts_by_building_cagg instead of scanning
+    # sensor_data; the () grouping set is the grand total row.
+    async with ts_conn() as conn:
+        rows = await conn.fetch("""
+            SELECT GROUPING(building) AS is_total, building, COALESCE(SUM(row_count), 0)::bigint AS rows,
+                   MIN(min_ts) AS min_ts, MAX(max_ts) AS max_ts
+            FROM sensor_counts_by_building_cagg
+            GROUP BY GROUPING SETS ((building), ())
+            ORDER BY is_total, building;
+        """)
+    *per_building, total = rows
+    body = {
+        "total_rows": total["rows"],
+        "min_timestamp": total["min_ts"],
+        "max_timestamp": total["max_ts"],
+        "rows_per_building": [{"building": r["building"], "rows": r["rows"]} for r in per_building]
     }
+    STATS_CACHE[key] = body
+    return ORJSONResponse(body)
 
 # ---------------- Raw Data (TimescaleDB) ----------------
 @app.get("/raw-data", summary="Get raw sensor data from TimescaleDB")
-def get_raw_data(
+async def get_raw_data(
     start: Optional[str] = Query(default=None, description="Start datetime (ISO8601 or YYYY-MM-DD). Optional."),
     end: Optional[str] = Query(default=None, description="End datetime (exclusive). Optional."),
     building: Optional[str] = Query(default=None, description="Filter by building name. Optional."),
     limit: int = Query(default=500, ge=1, le=10000, description="Max rows to return."),
-    offset: int = Query(default=0, ge=0, description="Offset for pagination."),
+    cursor: Optional[str] = Query(default=None, description="Pagination cursor (next_cursor of the previous page). Optional."),
+    after_ts: Optional[str] = Query(default=None, description="Timestamp of the last row already seen (use with after_id instead of cursor). Optional."),
+    after_id: Optional[int] = Query(default=None, description="id of the last row already seen (use with after_ts). Optional."),
     order: str = Query(default="asc", pattern="^(asc|desc)$", description="Sort by timestamp asc/desc."),
+    fields: Optional[str] = Query(default=None, pattern=r"^[a-z_,]+$", description="Comma-separated columns to return (id and timestamp are always included). Optional."),
     format: str = Query(default="json", pattern="^(json|csv)$", description="Response format."),
     x_api_key: Optional[str] = Header(default=None, alias="X-API-Key", description="API key header"),
 ):
@@ -113,89 +374,61 @@ def get_raw_data(
     start_dt = parse_dt(start) if start else None
     end_dt   = parse_dt(end) if end else None
 
-    sql = """
-        SELECT id, building, timestamp, temperature, humidity, occupancy
-        FROM sensor_data
-        WHERE 1=1
-    """
-    params: List = []
-    if start_dt:
-        sql += " AND timestamp >= %s"
-        params.append(start_dt)
-    if end_dt:
-        sql += " AND timestamp < %s"
-        params.append(end_dt)
-    if building:
-        sql += " AND building = %s"
-        params.append(building)
-
-    sql += f" ORDER BY timestamp {'ASC' if order=='asc' else 'DESC'}"
-    sql += " LIMIT %s OFFSET %s"
-    params.extend([limit, offset])
-
-    with ts_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
-            if format == "csv":
-                header = "id,building,timestamp,temperature,humidity,occupancy"
-                lines = [header] + [
-                    f"{r[0]},{r[1]},{r[2].isoformat()},{r[3]},{r[4]},{r[5]}"
-                    for r in rows
-                ]
-                return PlainTextResponse("\n".join(lines), media_type="text/csv")
-            else:
-                data = rows_to_dicts(cur, rows)
-                return {"count": len(data), "items": data}
+    after = keyset_after(cursor, after_ts, after_id, "after_ts", parse_dt)
+    filters = (start_dt, end_dt, building)
+    columns = select_columns(fields, RAW_DATA_FIELDS, "timestamp")
+    sql = select_page_sql("sensor_data", columns, "timestamp",
+                          *(bool(f) for f in filters), bool(after), order)
+    params = [f for f in filters if f] + [*after, limit]
+
+    if format == "csv":
+        return await csv_response(app.state.ts_pool, sql, params)
+
+    async with ts_conn() as conn:
+        rows = await conn.fetch(sql, *params)
+    data = [dict(r) for r in rows]
+    next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"]) if len(rows) == limit else None
+    # Returning the response directly skips FastAPI's jsonable_encoder pass:
+    # orjson serializes the datetimes and floats in each row itself.
+    return ORJSONResponse({"count": len(data), "items": data, "next_cursor": next_cursor})
 
 # ---------------- Analytics (PostgreSQL) ----------------
 @app.get("/analytics", summary="Get daily analytics from PostgreSQL (analytics_data)")
-def get_analytics(
+async def get_analytics(
+    request: Request,
     start_date: Optional[str] = Query(default=None, description="Start date (YYYY-MM-DD). Optional."),
     end_date: Optional[str] = Query(default=None, description="End date (exclusive, YYYY-MM-DD). Optional."),
     building: Optional[str] = Query(default=None, description="Filter by building. Optional."),
     limit: int = Query(default=500, ge=1, le=10000, description="Max rows to return."),
-    offset: int = Query(default=0, ge=0, description="Offset for pagination."),
+    cursor: Optional[str] = Query(default=None, description="Pagination cursor (next_cursor of the previous page). Optional."),
+    after_date: Optional[str] = Query(default=None, description="Date of the last row already seen (use with after_id instead of cursor). Optional."),
+    after_id: Optional[int] = Query(default=None, description="id of the last row already seen (use with after_date). Optional."),
     order: str = Query(default="asc", pattern="^(asc|desc)$", description="Sort order by date."),
+    fields: Optional[str] = Query(default=None, pattern=r"^[a-z_,]+$", description="Comma-separated columns to return (id and date are always included). Optional."),
     format: str = Query(default="json", pattern="^(json|csv)$", description="Response format."),
     x_api_key: Optional[str] = Header(default=None, alias="X-API-Key", description="API key header"),
 ):
     require_api_key(x_api_key)
+    key = cache_key(request)
+    if format == "json" and (rendered := ANALYTICS_CACHE.get(key)) is not None:
+        return conditional_response(request, rendered)
 
     start_dt = parse_dt(start_date) if start_date else None
     end_dt   = parse_dt(end_date) if end_date else None
 
-    sql = """
-        SELECT id, building, date, avg_temperature, avg_humidity, occupancy_rate
-        FROM analytics_data
-        WHERE 1=1
-    """
-    params: List = []
-    if start_dt:
-        sql += " AND date >= %s"
-        params.append(start_dt.date())
-    if end_dt:
-        sql += " AND date < %s"
-        params.append(end_dt.date())
-    if building:
-        sql += " AND building = %s"
-        params.append(building)
-
-    sql += f" ORDER BY date {'ASC' if order=='asc' else 'DESC'}"
-    sql += " LIMIT %s OFFSET %s"
-    params.extend([limit, offset])
-
-    with pg_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
-            if format == "csv":
-                header = "id,building,date,avg_temperature,avg_humidity,occupancy_rate"
-                lines = [header] + [
-                    f"{r[0]},{r[1]},{r[2]},{r[3]},{r[4]},{r[5]}"
-                    for r in rows
-                ]
-                return PlainTextResponse("\n".join(lines), media_type="text/csv")
-            else:
-                data = rows_to_dicts(cur, rows)
-                return {"count": len(data), "items": data}
+    after = keyset_after(cursor, after_date, after_id, "after_date", lambda d: parse_dt(d).date())
+    filters = (start_dt.date() if start_dt else None, end_dt.date() if end_dt else None, building)
+    columns = select_columns(fields, ANALYTICS_FIELDS, "date")
+    sql = select_page_sql("analytics_data", columns, "date",
+                          *(bool(f) for f in filters), bool(after), order)
+    params = [f for f in filters if f] + [*after, limit]
+
+    if format == "csv":
+        return await csv_response(app.state.pg_pool, sql, params)
+
+    async with pg_conn() as conn:
+        rows = await conn.fetch(sql, *params)
+    data = [dict(r) for r in rows]
+    next_cursor = encode_cursor(rows[-1]["date"], rows[-1]["id"]) if len(rows) == limit else None
+    rendered = ANALYTICS_CACHE[key] = render_json({"count": len(data), "items": data, "next_cursor": next_cursor})
+    return conditional_response(request, rendered)
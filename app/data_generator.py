@@ -1,19 +1,29 @@
 
+import io
+import numpy as np
+import pandas as pd
 import psycopg2
-import random
 from datetime import datetime, timedelta
 
 conn = psycopg2.connect(host="timescaledb", dbname="sensordata", user="admin", password="admin")
 cur = conn.cursor()
 
-start_date = datetime.now() - timedelta(days=365)
-for i in range(365*96):  # 15-min intervals for 1 year
-    timestamp = start_date + timedelta(minutes=15*i)
-    building = random.choice(["Building A", "Building B", "Building C"])
-    temp = round(random.uniform(18, 30), 2)
-    humidity = round(random.uniform(30, 70), 2)
-    occupancy = random.randint(0, 50)
-    cur.execute("INSERT INTO sensor_data (building, timestamp, temperature, humidity, occupancy) VALUES (%s,%s,%s,%s,%s)",
-                (building, timestamp, temp, humidity, occupancy))
+# 15-min intervals for 1 year, generated as whole arrays instead of row by row
+n = 365*96
+rng = np.random.default_rng()
+start_date = np.datetime64(datetime.now() - timedelta(days=365))
+df = pd.DataFrame({
+    "building": rng.choice(["Building A", "Building B", "Building C"], size=n),
+    "timestamp": start_date + np.arange(n) * np.timedelta64(15, "m"),
+    "temperature": np.round(rng.uniform(18, 30, n), 2),
+    "humidity": np.round(rng.uniform(30, 70, n), 2),
+    "occupancy": rng.integers(0, 50, n, endpoint=True),
+})
+
+# Bulk-load through COPY: one tab-separated buffer, no per-row INSERT parsing
+buf = io.StringIO()
+df.to_csv(buf, sep="\t", header=False, index=False)
+buf.seek(0)
+cur.copy_from(buf, "sensor_data", columns=("building", "timestamp", "temperature", "humidity", "occupancy"))
 conn.commit()
 cur.close()
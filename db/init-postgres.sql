@@ -6,4 +6,24 @@ CREATE TABLE analytics_data (
     avg_temperature DOUBLE PRECISION,
     avg_humidity DOUBLE PRECISION,
     occupancy_rate DOUBLE PRECISION
-)
+);
+
+-- Required by transform.py's ON CONFLICT (building, date) upsert, and serves
+-- the API's "building = ? AND date range ORDER BY date, id [DESC]" reads.
+CREATE UNIQUE INDEX IF NOT EXISTS analytics_building_date_uidx ON analytics_data (building, date);
+
+-- Daily rollups read straight from TimescaleDB's analytics_data_cagg, so
+-- transform.py can upsert with a single INSERT ... SELECT in this database.
+-- Connects to TimescaleDB directly (server to server), not through PgBouncer.
+CREATE EXTENSION IF NOT EXISTS postgres_fdw;
+CREATE SERVER IF NOT EXISTS ts_srv FOREIGN DATA WRAPPER postgres_fdw
+    OPTIONS (host 'timescaledb', port '5432', dbname 'sensordata');
+CREATE USER MAPPING IF NOT EXISTS FOR CURRENT_USER SERVER ts_srv
+    OPTIONS (user 'admin', password 'admin');
+CREATE FOREIGN TABLE IF NOT EXISTS analytics_daily_fdw (
+    building VARCHAR(50),
+    day TIMESTAMPTZ,
+    avg_temperature DOUBLE PRECISION,
+    avg_humidity DOUBLE PRECISION,
+    occupancy_rate DOUBLE PRECISION
+) SERVER ts_srv OPTIONS (table_name 'analytics_data_cagg');
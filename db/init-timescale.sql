@@ -1,11 +1,59 @@
 
 CREATE EXTENSION IF NOT EXISTS timescaledb;
 CREATE TABLE sensor_data (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     building VARCHAR(50),
     timestamp TIMESTAMPTZ NOT NULL,
     temperature DOUBLE PRECISION,
     humidity DOUBLE PRECISION,
-    occupancy INT
+    occupancy INT,
+    -- Hypertables only allow unique indexes that include the partitioning column.
+    PRIMARY KEY (id, timestamp)
 );
-SELECT create_hypertable('sensor_data', 'timestamp')
+SELECT create_hypertable('sensor_data', 'timestamp');
+
+-- Matches the API's "building = ? AND timestamp range ORDER BY timestamp, id" shape:
+-- filtered reads are an index range scan in timestamp order, and the id tie-break
+-- only needs an Incremental Sort over equal timestamps (created per chunk).
+CREATE INDEX IF NOT EXISTS sensor_data_building_ts_idx ON sensor_data (building, timestamp DESC);
+
+-- Daily rollups per building, maintained incrementally by TimescaleDB.
+-- transform.py refreshes the requested window and ships it to analytics_data.
+CREATE MATERIALIZED VIEW analytics_data_cagg
+WITH (timescaledb.continuous) AS
+SELECT
+    building,
+    time_bucket('1 day', timestamp) AS day,
+    AVG(temperature) AS avg_temperature,
+    AVG(humidity)    AS avg_humidity,
+    AVG(CASE WHEN occupancy > 0 THEN 1.0 ELSE 0.0 END) AS occupancy_rate
+FROM sensor_data
+GROUP BY building, time_bucket('1 day', timestamp)
+WITH NO DATA;
+
+SELECT add_continuous_aggregate_policy('analytics_data_cagg',
+    start_offset      => INTERVAL '3 days',
+    end_offset        => INTERVAL '1 hour',
+    schedule_interval => INTERVAL '1 hour');
+
+-- Hourly row counts and time bounds per building for /raw-stats. Real-time
+-- aggregation (materialized_only = false) adds rows newer than the last refresh,
+-- so counts track new inserts between refreshes without scanning the hypertable.
+CREATE MATERIALIZED VIEW sensor_counts_by_building_cagg
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT
+    building,
+    time_bucket('1 hour', timestamp) AS bucket,
+    COUNT(*)       AS row_count,
+    MIN(timestamp) AS min_ts,
+    MAX(timestamp) AS max_ts
+FROM sensor_data
+GROUP BY building, time_bucket('1 hour', timestamp)
+WITH NO DATA;
+
+-- start_offset NULL: back-filled history (e.g. app/data_generator.py) is picked up too;
+-- only invalidated buckets are recomputed on each run.
+SELECT add_continuous_aggregate_policy('sensor_counts_by_building_cagg',
+    start_offset      => NULL,
+    end_offset        => INTERVAL '1 hour',
+    schedule_interval => INTERVAL '1 hour');
@@ -0,0 +1,17 @@
+-- sensordata (TimescaleDB): composite index for existing deployments
+-- (fresh ones get it from init-timescale.sql).
+--   psql -h timescaledb -U admin -d sensordata -f db/migrations/001_sensordata_indexes.sql
+--
+-- CREATE INDEX CONCURRENTLY is not supported on hypertables; transaction_per_chunk
+-- builds one chunk at a time instead, so writes only block on the chunk being indexed.
+CREATE INDEX IF NOT EXISTS sensor_data_building_ts_idx
+    ON sensor_data (building, timestamp DESC)
+    WITH (timescaledb.transaction_per_chunk);
+
+-- Check the range comes off the index in timestamp order. The id tie-break
+-- only adds an Incremental Sort (Presorted Key: "timestamp") over rows with
+-- equal timestamps, so the LIMIT still stops the scan early:
+--   EXPLAIN (ANALYZE, BUFFERS)
+--   SELECT * FROM sensor_data
+--   WHERE timestamp >= now() - INTERVAL '7 days' AND building = 'Building A'
+--   ORDER BY timestamp DESC, id DESC LIMIT 500;
@@ -0,0 +1,16 @@
+-- analytics (PostgreSQL): composite index for existing deployments
+-- (fresh ones get it from init-postgres.sql).
+--   psql -h postgres -U admin -d analytics -f db/migrations/002_analytics_indexes.sql
+--
+-- A btree is scanned backwards just as well, so the unique (building, date)
+-- index also serves ORDER BY date DESC; no separate DESC index is needed.
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS analytics_building_date_uidx
+    ON analytics_data (building, date);
+
+-- Check the range comes off the index in date order. The id tie-break only
+-- adds an Incremental Sort (Presorted Key: date) over rows with equal dates,
+-- so the LIMIT still stops the scan early:
+--   EXPLAIN (ANALYZE, BUFFERS)
+--   SELECT * FROM analytics_data
+--   WHERE date >= CURRENT_DATE - 30 AND building = 'Building A'
+--   ORDER BY date DESC, id DESC LIMIT 500;
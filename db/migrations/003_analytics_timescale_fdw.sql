@@ -0,0 +1,20 @@
+-- analytics (PostgreSQL): foreign table over TimescaleDB's daily continuous
+-- aggregate for existing deployments (fresh ones get it from init-postgres.sql).
+--   psql -h postgres -U admin -d analytics -f db/migrations/003_analytics_timescale_fdw.sql
+--
+-- Requires analytics_data_cagg in sensordata (created by init-timescale.sql, or
+-- by 005_analytics_daily_cagg.sql on existing deployments). Adjust the
+-- server/user mapping options if TimescaleDB is not reachable as
+-- timescaledb:5432 with the default credentials.
+CREATE EXTENSION IF NOT EXISTS postgres_fdw;
+CREATE SERVER IF NOT EXISTS ts_srv FOREIGN DATA WRAPPER postgres_fdw
+    OPTIONS (host 'timescaledb', port '5432', dbname 'sensordata');
+CREATE USER MAPPING IF NOT EXISTS FOR CURRENT_USER SERVER ts_srv
+    OPTIONS (user 'admin', password 'admin');
+CREATE FOREIGN TABLE IF NOT EXISTS analytics_daily_fdw (
+    building VARCHAR(50),
+    day TIMESTAMPTZ,
+    avg_temperature DOUBLE PRECISION,
+    avg_humidity DOUBLE PRECISION,
+    occupancy_rate DOUBLE PRECISION
+) SERVER ts_srv OPTIONS (table_name 'analytics_data_cagg');
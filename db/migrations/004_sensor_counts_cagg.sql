@@ -0,0 +1,26 @@
+-- sensordata (TimescaleDB): per-building counts aggregate read by /raw-stats,
+-- for existing deployments (fresh ones get it from init-timescale.sql).
+--   psql -h timescaledb -U admin -d sensordata -f db/migrations/004_sensor_counts_cagg.sql
+--
+-- WITH NO DATA keeps the statement cheap; the policy (or a manual
+-- CALL refresh_continuous_aggregate('sensor_counts_by_building_cagg', NULL, NULL))
+-- materializes history. Until then real-time aggregation answers from sensor_data.
+CREATE MATERIALIZED VIEW IF NOT EXISTS sensor_counts_by_building_cagg
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT
+    building,
+    time_bucket('1 hour', timestamp) AS bucket,
+    COUNT(*)       AS row_count,
+    MIN(timestamp) AS min_ts,
+    MAX(timestamp) AS max_ts
+FROM sensor_data
+GROUP BY building, time_bucket('1 hour', timestamp)
+WITH NO DATA;
+
+-- start_offset NULL: back-filled history (e.g. app/data_generator.py) is picked up too;
+-- only invalidated buckets are recomputed on each run.
+SELECT add_continuous_aggregate_policy('sensor_counts_by_building_cagg',
+    start_offset      => NULL,
+    end_offset        => INTERVAL '1 hour',
+    schedule_interval => INTERVAL '1 hour',
+    if_not_exists     => true);
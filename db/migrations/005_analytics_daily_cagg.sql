@@ -0,0 +1,24 @@
+-- sensordata (TimescaleDB): daily rollup aggregate refreshed by transform.py and
+-- read through analytics_daily_fdw, for existing deployments (fresh ones get it
+-- from init-timescale.sql).
+--   psql -h timescaledb -U admin -d sensordata -f db/migrations/005_analytics_daily_cagg.sql
+--
+-- WITH NO DATA keeps the statement cheap; the next transform.py run (or the
+-- policy) materializes the window it covers.
+CREATE MATERIALIZED VIEW IF NOT EXISTS analytics_data_cagg
+WITH (timescaledb.continuous) AS
+SELECT
+    building,
+    time_bucket('1 day', timestamp) AS day,
+    AVG(temperature) AS avg_temperature,
+    AVG(humidity)    AS avg_humidity,
+    AVG(CASE WHEN occupancy > 0 THEN 1.0 ELSE 0.0 END) AS occupancy_rate
+FROM sensor_data
+GROUP BY building, time_bucket('1 day', timestamp)
+WITH NO DATA;
+
+SELECT add_continuous_aggregate_policy('analytics_data_cagg',
+    start_offset      => INTERVAL '3 days',
+    end_offset        => INTERVAL '1 hour',
+    schedule_interval => INTERVAL '1 hour',
+    if_not_exists     => true);
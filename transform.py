@@ -3,6 +3,7 @@
 # Purpose: Aggregate raw time-series data from TimescaleDB into daily analytics
 #          and upsert results into PostgreSQL (analytics DB).
 
+import io
 import os
 import sys
 import logging
@@ -10,18 +11,20 @@ from datetime import datetime
 from typing import Optional, List, Tuple
 
 import psycopg2
-from psycopg2.extras import execute_values
+import psycopg2.errors
 
 # ---------- Config ----------
-TIMESCALE_HOST = os.getenv("TIMESCALE_HOST", "timescaledb")
-TIMESCALE_PORT = int(os.getenv("TIMESCALE_PORT", "5432"))
-TIMESCALE_DB   = os.getenv("TIMESCALE_DB", "sensordata")
+# Defaults go through PgBouncer's *_batch aliases, which skip the API's
+# statement_timeout (see db/pgbouncer/pgbouncer.ini).
+TIMESCALE_HOST = os.getenv("TIMESCALE_HOST", "pgbouncer")
+TIMESCALE_PORT = int(os.getenv("TIMESCALE_PORT", "6432"))
+TIMESCALE_DB   = os.getenv("TIMESCALE_DB", "sensordata_batch")
 TIMESCALE_USER = os.getenv("TIMESCALE_USER", "admin")
 TIMESCALE_PASS = os.getenv("TIMESCALE_PASS", "admin")
 
-PG_HOST = os.getenv("PG_HOST", "postgres")
-PG_PORT = int(os.getenv("PG_PORT", "5432"))
-PG_DB   = os.getenv("PG_DB", "analytics")
+PG_HOST = os.getenv("PG_HOST", "pgbouncer")
+PG_PORT = int(os.getenv("PG_PORT", "6432"))
+PG_DB   = os.getenv("PG_DB", "analytics_batch")
 PG_USER = os.getenv("PG_USER", "admin")
 PG_PASS = os.getenv("PG_PASS", "admin")
 
@@ -34,10 +37,13 @@ logging.basicConfig(
 # ---------- Helpers ----------
 
 def get_timescale_conn():
-    return psycopg2.connect(
+    conn = psycopg2.connect(
         host=TIMESCALE_HOST, port=TIMESCALE_PORT,
         dbname=TIMESCALE_DB, user=TIMESCALE_USER, password=TIMESCALE_PASS
     )
+    # refresh_continuous_aggregate cannot run inside a transaction block.
+    conn.autocommit = True
+    return conn
 
 def get_pg_conn():
     return psycopg2.connect(
@@ -77,46 +83,79 @@ def parse_date(date_str: Optional[str]) -> Optional[datetime]:
 
 # ---------- Core Transform ----------
 
+# psycopg2 binds parameters client-side, so an absent bound arrives as a literal
+# NULL and the planner folds its predicate away: one fixed template covers every
+# combination of bounds without building SQL per run.
+DAILY_AGGREGATES_SQL = """
+    SELECT building, day::date AS date, avg_temperature, avg_humidity, occupancy_rate
+    FROM analytics_data_cagg
+    WHERE (%(start)s::timestamptz IS NULL OR day >= date_trunc('day', %(start)s::timestamptz))
+      AND (%(end)s::timestamptz IS NULL OR day < %(end)s::timestamptz)
+    ORDER BY building, day;
+"""
+
+# Same upsert as upsert_analytics, but run entirely inside the analytics DB:
+# analytics_daily_fdw is a postgres_fdw foreign table over analytics_data_cagg.
+# Bounds are passed as plain strings so they become constants that postgres_fdw
+# can push down to TimescaleDB instead of pulling the whole aggregate.
+FDW_UPSERT_SQL = """
+    INSERT INTO analytics_data (building, date, avg_temperature, avg_humidity, occupancy_rate)
+    SELECT building, day::date, avg_temperature, avg_humidity, occupancy_rate
+    FROM analytics_daily_fdw
+    WHERE (%(start)s IS NULL OR day >= %(start)s)
+      AND (%(end)s IS NULL OR day < %(end)s)
+    ON CONFLICT (building, date) DO UPDATE SET
+        avg_temperature = EXCLUDED.avg_temperature,
+        avg_humidity    = EXCLUDED.avg_humidity,
+        occupancy_rate  = EXCLUDED.occupancy_rate;
+"""
+
+def refresh_daily_aggregates(conn_ts, start_dt: Optional[datetime], end_dt: Optional[datetime]):
+    """
+    Refresh the analytics_data_cagg continuous aggregate over the requested
+    window, so only changed buckets are re-aggregated instead of rescanning
+    sensor_data. The window is widened to whole days, since the aggregate is per day.
+    """
+    logging.info("Refreshing daily aggregates in TimescaleDB...")
+    try:
+        with conn_ts.cursor() as cur:
+            # NULL bounds refresh the whole aggregate on that side.
+            cur.execute(
+                """
+                CALL refresh_continuous_aggregate('analytics_data_cagg',
+                    date_trunc('day', %s::timestamptz),
+                    date_trunc('day', %s::timestamptz) + INTERVAL '1 day');
+                """,
+                (start_dt, end_dt),
+            )
+    except psycopg2.errors.UndefinedTable:
+        logging.error("analytics_data_cagg is missing: apply db/migrations/005_analytics_daily_cagg.sql.")
+        sys.exit(1)
+
 def compute_daily_aggregates(conn_ts, start_dt: Optional[datetime], end_dt: Optional[datetime]) -> List[Tuple]:
     """
-    Compute daily aggregates per building directly in SQL for performance.
+    Read the refreshed daily rows back from analytics_data_cagg.
     Returns list of tuples: (building, date, avg_temp, avg_humidity, occupancy_rate)
     - occupancy_rate = fraction of intervals with occupancy > 0
     """
-    logging.info("Computing daily aggregates from TimescaleDB...")
-    sql_base = """
-        SELECT
-            building,
-            DATE_TRUNC('day', timestamp)::date AS date,
-            AVG(temperature) AS avg_temperature,
-            AVG(humidity)    AS avg_humidity,
-            AVG(CASE WHEN occupancy > 0 THEN 1.0 ELSE 0.0 END) AS occupancy_rate
-        FROM sensor_data
-        WHERE 1=1
-    """
-    params = []
-    if start_dt:
-        sql_base += " AND timestamp >= %s"
-        params.append(start_dt)
-    if end_dt:
-        sql_base += " AND timestamp < %s"
-        params.append(end_dt)
-    sql_base += """
-        GROUP BY building, DATE_TRUNC('day', timestamp)::date
-        ORDER BY building, DATE_TRUNC('day', timestamp)::date;
-    """
-
     with conn_ts.cursor() as cur:
-        cur.execute(sql_base, params)
+        cur.execute(DAILY_AGGREGATES_SQL, {"start": start_dt, "end": end_dt})
         rows = cur.fetchall()
 
     logging.info("Aggregated %d daily rows.", len(rows))
     return rows
 
+# COPY text format treats backslash, tab, newline and carriage return as syntax.
+_COPY_TEXT_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+def _copy_text_value(v) -> str:
+    return "\\N" if v is None else str(v).translate(_COPY_TEXT_ESCAPES)
+
 def upsert_analytics(conn_pg, rows: List[Tuple]):
     """
     Upsert aggregated rows into analytics_data.
-    ON CONFLICT (building, date) DO UPDATE.
+    Rows are COPYed into a transaction-scoped staging table, then merged with
+    one INSERT ... SELECT ... ON CONFLICT (building, date) DO UPDATE.
     """
     if not rows:
         logging.info("No rows to upsert.")
@@ -124,9 +163,16 @@ def upsert_analytics(conn_pg, rows: List[Tuple]):
 
     ensure_unique_index_on_analytics(conn_pg)
 
+    # COPY text format: tab-separated, \N for NULL, special characters escaped.
+    buf = io.StringIO()
+    for r in rows:
+        buf.write("\t".join(_copy_text_value(v) for v in r) + "\n")
+    buf.seek(0)
+
     insert_sql = """
         INSERT INTO analytics_data (building, date, avg_temperature, avg_humidity, occupancy_rate)
-        VALUES %s
+        SELECT building, date, avg_temperature, avg_humidity, occupancy_rate
+        FROM analytics_stage
         ON CONFLICT (building, date) DO UPDATE SET
             avg_temperature = EXCLUDED.avg_temperature,
             avg_humidity    = EXCLUDED.avg_humidity,
@@ -134,10 +180,39 @@ def upsert_analytics(conn_pg, rows: List[Tuple]):
     """
 
     with conn_pg.cursor() as cur:
-        execute_values(cur, insert_sql, rows, page_size=1000)
+        # Only the data columns: LIKE analytics_data would also copy the id default
+        # and burn a sequence value per staged row.
+        cur.execute("""
+            CREATE TEMP TABLE analytics_stage ON COMMIT DROP AS
+            SELECT building, date, avg_temperature, avg_humidity, occupancy_rate
+            FROM analytics_data WITH NO DATA;
+        """)
+        cur.copy_from(buf, "analytics_stage",
+                      columns=("building", "date", "avg_temperature", "avg_humidity", "occupancy_rate"))
+        cur.execute(insert_sql)
     conn_pg.commit()
     logging.info("Upserted %d rows into analytics_data.", len(rows))
 
+def upsert_analytics_via_fdw(conn_pg, start_dt: Optional[datetime], end_dt: Optional[datetime]):
+    """
+    Upsert the daily aggregates with a single INSERT ... SELECT from the
+    analytics_daily_fdw foreign table: rows never pass through Python.
+    """
+    ensure_unique_index_on_analytics(conn_pg)
+
+    # Floor the start to the day so the bucket it falls in is included.
+    start_day = start_dt.replace(hour=0, minute=0, second=0, microsecond=0).isoformat() if start_dt else None
+    params = {"start": start_day, "end": end_dt.isoformat() if end_dt else None}
+    try:
+        with conn_pg.cursor() as cur:
+            cur.execute(FDW_UPSERT_SQL, params)
+            count = cur.rowcount
+    except psycopg2.errors.UndefinedTable:
+        logging.error("analytics_daily_fdw is missing: apply db/migrations/003_analytics_timescale_fdw.sql or rerun with --no-fdw.")
+        sys.exit(1)
+    conn_pg.commit()
+    logging.info("Upserted %d rows into analytics_data via postgres_fdw.", count)
+
 # ---------- CLI ----------
 
 def main():
@@ -148,6 +223,8 @@ def main():
     )
     parser.add_argument("--start-date", help="Start date (YYYY-MM-DD or ISO). Optional.", default=None)
     parser.add_argument("--end-date", help="End date (YYYY-MM-DD or ISO). Optional (exclusive).", default=None)
+    parser.add_argument("--no-fdw", action="store_true",
+                        help="Copy rows through this process instead of postgres_fdw (analytics DB cannot reach TimescaleDB).")
     args = parser.parse_args()
 
     start_dt = parse_date(args.start_date)
@@ -169,9 +246,13 @@ def main():
             end_dt = end_dt or (max_dt.replace(hour=23, minute=59, second=59, microsecond=999999))
             logging.info("Using date range: %s to %s", start_dt.isoformat(), end_dt.isoformat())
 
-        # Compute & Upsert
-        rows = compute_daily_aggregates(conn_ts, start_dt, end_dt)
-        upsert_analytics(conn_pg, rows)
+        # Refresh & Upsert
+        refresh_daily_aggregates(conn_ts, start_dt, end_dt)
+        if args.no_fdw:
+            rows = compute_daily_aggregates(conn_ts, start_dt, end_dt)
+            upsert_analytics(conn_pg, rows)
+        else:
+            upsert_analytics_via_fdw(conn_pg, start_dt, end_dt)
 
     finally:
         conn_ts.close()